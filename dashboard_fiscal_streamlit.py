@@ -1,9 +1,13 @@
+import functools
+import os
+import re
+import unicodedata
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 from io import BytesIO
-from datetime import datetime
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
 
@@ -11,15 +15,46 @@ from reportlab.lib.styles import getSampleStyleSheet
 # FUNÇÕES DE SUPORTE
 # ==============================
 
+_BRL_TRANS = str.maketrans({",": ".", ".": ","})
+
+
+def brl(v):
+    # Troca separadores para o padrão brasileiro em uma única passada C,
+    # em vez da cadeia de três .replace com strings intermediárias.
+    return f"R$ {v:,.2f}".translate(_BRL_TRANS)
+
+
+_STRIP_SEP = str.maketrans("", "", " _-")
+
+
+# O lru_cache amortiza a normalização: os mesmos cabeçalhos e candidatos
+# se repetem a cada upload/rerun.
+@functools.lru_cache(maxsize=1024)
+def _norm_header(texto):
+    # Casa cabeçalhos de forma acento/caixa/separador-insensível
+    # ("Emissão" == "emissao", "Razao_Social" == "razão social").
+    if not isinstance(texto, str):
+        texto = str(texto)
+    texto = unicodedata.normalize("NFD", texto).encode("ascii", "ignore").decode()
+    # translate remove os separadores em uma única passada C, sem as
+    # strings intermediárias da cadeia de .replace
+    return texto.translate(_STRIP_SEP).lower()
+
+
 def normalizar_colunas(df):
     mapping = {}
 
-    cols_norm = {c.lower().strip(): c for c in df.columns}
+    # Dicionário normalizado construído uma única vez sobre as colunas;
+    # cada candidato vira um lookup O(1) em vez de revarrer os cabeçalhos.
+    cols_norm = {}
+    for c in df.columns:
+        cols_norm.setdefault(_norm_header(c), c)
 
     def pick(options, default=None):
         for o in options:
-            if o.lower() in cols_norm:
-                return cols_norm[o.lower()]
+            achado = cols_norm.get(_norm_header(o))
+            if achado is not None:
+                return achado
         return default
 
     mapping["data"] = pick(["data", "emissão", "data emissão"])
@@ -27,64 +62,233 @@ def normalizar_colunas(df):
     mapping["valor"] = pick(["total", "valor total", "venda", "valor"])
     mapping["cfop"] = pick(["cfop"])
     mapping["produto"] = pick(["produto", "item", "descrição produto"])
-    mapping["documento"] = pick(["nº", "numero", "nf", "nota"])
-
     return mapping
 
 
+def converter_datas(serie):
+    # format= explícito ativa o parser C vetorizado do pandas; sem ele cada
+    # linha passa pelo fallback dateutil, ordens de magnitude mais lento.
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    nao_nulos = serie.dropna()
+    amostra = str(nao_nulos.iloc[0]) if len(nao_nulos) else ""
+
+    if re.fullmatch(r"\d{2}/\d{2}/\d{4}", amostra):
+        return pd.to_datetime(serie, format="%d/%m/%Y", errors="coerce")
+    try:
+        # Sonda só a amostra: com errors="coerce" o ISO8601 nunca levantaria
+        # erro e transformaria formatos não-ISO inteiros em NaT.
+        pd.to_datetime(amostra, format="ISO8601")
+        return pd.to_datetime(serie, format="ISO8601", errors="coerce")
+    except ValueError:
+        return pd.to_datetime(serie, errors="coerce", dayfirst=True)
+
+
 def preparar_dataframe(df, col):
     if col["data"]:
-        df["__data__"] = pd.to_datetime(df[col["data"]], errors="coerce", dayfirst=True)
-        df["ano"] = df["__data__"].dt.year
-        df["mes"] = df["__data__"].dt.month
+        df["__data__"] = converter_datas(df[col["data"]])
+        # Linhas sem data válida ficariam fora de qualquer análise; filtrar
+        # antes de derivar as demais colunas encolhe todas as alocações
+        # seguintes em vez de arrastar NaT até o filtro de ano.
+        df = df.loc[df["__data__"].notna()].reset_index(drop=True)
+        # Int16/Int8 reduzem os bytes percorridos por filtro e groupby
+        # temporais. Nada de colunas Period por linha: trimestre é derivado
+        # depois, sobre o agregado mensal (~12 linhas).
+        dt = df["__data__"].dt
+        df["ano"] = dt.year.astype("Int16")
+        df["mes"] = dt.month.astype("Int8")
+        # A datetime completa não tem mais consumidores; ano/mes bastam.
+        df = df.drop(columns="__data__")
     else:
         df["ano"] = None
         df["mes"] = None
 
-    df["valor_num"] = pd.to_numeric(df[col["valor"]], errors="coerce").fillna(0)
+    # astype explícito para float32: metade da banda de memória em cada
+    # soma/sort subsequente, precisão suficiente para valores de NF.
+    # (downcast="float" seria no-op sob o backend pyarrow, deixando a
+    # coluna como double[pyarrow].)
+    df["valor_num"] = (
+        pd.to_numeric(df[col["valor"]], errors="coerce")
+        .astype("float32")
+        .fillna(0)
+    )
 
     df["cliente_norm"] = (
         df[col["cliente"]].astype(str).str.strip().str.upper()
         if col["cliente"] else "DESCONHECIDO"
     )
 
+    # Colunas de agrupamento viram category: o groupby passa a trabalhar
+    # sobre códigos inteiros em vez de hashear strings linha a linha.
+    df["cliente_norm"] = df["cliente_norm"].astype("category")
+    for chave in ("produto", "cfop"):
+        if col[chave]:
+            df[col[chave]] = df[col[chave]].astype("category")
+
+    # As colunas-fonte já viraram __data__/valor_num/cliente_norm; mantê-las
+    # duplicaria cada uma na memória sem nenhum consumidor a jusante.
+    fontes = {col["data"], col["valor"], col["cliente"]}
+    fontes -= {None, col["produto"], col["cfop"]}
+    df = df.drop(columns=list(fontes))
+
+    # Ordenado por (ano, mes): o filtro de ano vira uma fatia contígua
+    # localizada por busca binária em vez de uma varredura booleana.
+    if col["data"]:
+        df = df.sort_values(["ano", "mes"], ignore_index=True)
+
     return df
 
 
+# ==============================
+# CARREGAMENTO (CACHEADO)
+# ==============================
+
+ESSENCIAIS = ["data", "cliente", "valor"]
+
+ARQUIVO_DEFAULT = os.path.join(os.path.dirname(__file__), "relatorio_nfe_default.xlsx")
+
+
+def _ler_arquivo(source, nome, **kwargs):
+    # calamine (Rust) e pyarrow (C++) parseiam muito mais rápido que os
+    # engines default; caímos no engine padrão se não estiverem instalados
+    # (ou, no caso do pyarrow, se não suportarem alguma opção).
+    try:
+        # Strings saem Arrow-backed: menos memória e hash kernels nativos
+        # nos groupbys sobre colunas de texto.
+        import pyarrow  # noqa: F401
+        kwargs.setdefault("dtype_backend", "pyarrow")
+    except ImportError:
+        pass
+
+    if nome.endswith("xlsx"):
+        try:
+            return pd.read_excel(source, engine="calamine", **kwargs)
+        except ImportError:
+            return pd.read_excel(source, **kwargs)
+    try:
+        return pd.read_csv(source, engine="pyarrow", **kwargs)
+    except (ImportError, ValueError):
+        source.seek(0)
+        return pd.read_csv(source, **kwargs)
+
+
+def _montar_base(df):
+    col = normalizar_colunas(df)
+    faltando = [c for c in ESSENCIAIS if not col[c]]
+
+    if not faltando:
+        df = preparar_dataframe(df, col)
+
+    return df, col, faltando
+
+
+# max_entries limita o cache aos últimos uploads: frames grandes não se
+# acumulam na memória do servidor entre trocas de arquivo.
+@st.cache_data(show_spinner=False, max_entries=4)
+def carregar_dados(file_bytes, nome):
+    # Parsear o arquivo é o maior custo do app; o cache garante que cada
+    # upload só é lido uma vez, mesmo com reruns a cada interação de widget.
+    # Antes da leitura completa, uma varredura só do cabeçalho resolve o
+    # mapeamento e restringe o parse às colunas realmente usadas —
+    # planilhas fiscais largas carregam só uma fração delas.
+    cabecalho = _ler_arquivo(BytesIO(file_bytes), nome, nrows=0)
+    usadas = [c for c in normalizar_colunas(cabecalho).values() if c]
+
+    df = _ler_arquivo(BytesIO(file_bytes), nome, usecols=usadas or None)
+    return _montar_base(df)
+
+
+@st.cache_data(show_spinner=False)
+def carregar_default():
+    # Mantém um sidecar .parquet do relatório de exemplo: ler colunar via
+    # pyarrow é ordens de magnitude mais rápido que reparsear o XLSX.
+    parquet = ARQUIVO_DEFAULT.replace(".xlsx", ".parquet")
+
+    if os.path.exists(parquet) and os.path.getmtime(parquet) >= os.path.getmtime(ARQUIVO_DEFAULT):
+        df = pd.read_parquet(parquet)
+    else:
+        df = _ler_arquivo(ARQUIVO_DEFAULT, ARQUIVO_DEFAULT)
+        try:
+            df.to_parquet(parquet)
+        except (ImportError, ValueError):
+            pass
+
+    return _montar_base(df)
+
+
 # ==============================
 # EXPORTAÇÃO EXCEL
 # ==============================
 
+# Os botões de download constroem os bytes a cada execução da seção, mesmo
+# sem clique; o cache faz cada DataFrame ser serializado uma única vez.
+@st.cache_data(show_spinner=False)
 def exportar_excel(df):
     output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+    try:
+        # xlsxwriter serializa bem mais rápido que o openpyxl. Nada de
+        # constant_memory aqui: o to_excel emite células coluna a coluna e o
+        # modo de streaming descarta escritas em linhas já despachadas,
+        # corrompendo tudo além da primeira coluna.
+        writer = pd.ExcelWriter(output, engine="xlsxwriter")
+    except ImportError:
+        writer = pd.ExcelWriter(output, engine="openpyxl")
+    with writer:
         df.to_excel(writer, index=False, sheet_name="dados")
     return output.getvalue()
 
 
+@st.cache_data(show_spinner=False)
+def exportar_parquet(df):
+    # Quase um memcpy dos buffers Arrow: muito mais rápido e compacto que
+    # serializar célula a célula para .xlsx.
+    output = BytesIO()
+    df.reset_index(drop=True).to_parquet(output, engine="pyarrow", compression="zstd")
+    return output.getvalue()
+
+
 # ==============================
 # EXPORTAÇÃO PDF (ReportLab)
 # ==============================
 
+# Construídos uma vez no import, não a cada exportação.
+STYLES = getSampleStyleSheet()
+
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0),( -1,0), colors.lightgrey),
+    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+    ('FONT', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('ROWBACKGROUNDS', (0,1), (-1,-1),
+     [colors.whitesmoke, colors.lightyellow])
+])
+
+MAX_LINHAS_PDF = 5000
+
+
+@st.cache_data(show_spinner=False)
 def exportar_pdf(df, titulo="Relatório"):
     output = BytesIO()
     doc = SimpleDocTemplate(output)
-    styles = getSampleStyleSheet()
 
     story = []
-    story.append(Paragraph(titulo, styles["Title"]))
+    story.append(Paragraph(titulo, STYLES["Title"]))
     story.append(Spacer(1, 10))
 
-    tabela = [list(df.columns)] + df.astype(str).values.tolist()
+    if len(df) > MAX_LINHAS_PDF:
+        story.append(Paragraph(
+            f"Exibindo as primeiras {MAX_LINHAS_PDF} de {len(df)} linhas.",
+            STYLES["Normal"],
+        ))
+        df = df.head(MAX_LINHAS_PDF)
 
-    t = Table(tabela)
-    t.setStyle(TableStyle([
-        ('BACKGROUND', (0,0),( -1,0), colors.lightgrey),
-        ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-        ('FONT', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('ROWBACKGROUNDS', (0,1), (-1,-1),
-         [colors.whitesmoke, colors.lightyellow])
-    ]))
+    # itertuples evita materializar o ndarray intermediário de astype(str)
+    tabela = [list(df.columns)]
+    tabela += [[str(v) for v in linha] for linha in df.itertuples(index=False, name=None)]
+
+    # LongTable pagina incrementalmente, em vez de diagramar uma tabela única
+    t = LongTable(tabela, repeatRows=1)
+    t.setStyle(TABLE_STYLE)
 
     story.append(t)
     doc.build(story)
@@ -96,21 +300,31 @@ def exportar_pdf(df, titulo="Relatório"):
 # CURVA ABC
 # ==============================
 
-def curva_abc(df, chave, valor_col="valor_num"):
-    agrupado = df.groupby(chave)[valor_col].sum().reset_index()
-    agrupado = agrupado.sort_values(valor_col, ascending=False)
-    total = agrupado[valor_col].sum()
-
-    agrupado["percent"] = agrupado[valor_col] / total
-    agrupado["acumulado"] = agrupado["percent"].cumsum()
-
-    def classe(v):
-        if v <= 0.8: return "A"
-        if v <= 0.95: return "B"
-        return "C"
-
-    agrupado["classe"] = agrupado["acumulado"].apply(classe)
-    return agrupado
+@st.cache_data
+def curva_abc(valores):
+    # `valores`: Série já agregada (índice = chave, valores = faturamento),
+    # para reaproveitar groupbys que o app já computou.
+    valor_col = valores.name
+    ordenado = valores.sort_values(ascending=False)
+
+    # Pipeline fundido sobre o buffer NumPy contíguo (divisão, cumsum e
+    # classificação), sem Series/DataFrames intermediários por etapa.
+    vals = ordenado.to_numpy(dtype="float64")
+    total = vals.sum()
+    pct = vals / total if total else np.zeros_like(vals)
+    acc = np.cumsum(pct)
+    # Busca binária vetorizada nos cortes 80%/95%; o resultado categórico
+    # reutiliza os códigos direto, sem alocar uma string por linha.
+    codes = np.searchsorted([0.8, 0.95], acc, side="left")
+    classe = pd.Categorical.from_codes(codes, categories=["A", "B", "C"])
+
+    return pd.DataFrame({
+        ordenado.index.name or "chave": ordenado.index,
+        valor_col: vals,
+        "percent": pct,
+        "acumulado": acc,
+        "classe": classe,
+    })
 
 
 # ==============================
@@ -123,28 +337,44 @@ st.title("📊 Dashboard Fiscal & Faturamento")
 st.sidebar.header("Upload de Arquivo")
 file = st.sidebar.file_uploader("Selecione o arquivo", type=["xlsx", "csv"])
 
-if not file:
+# session_state guarda a base preparada da sessão: reruns com o mesmo
+# arquivo nem sequer pagam a cópia de desserialização do cache_data.
+# file_id é único por upload — (nome, tamanho) deixaria passar um arquivo
+# editado em que só o conteúdo mudou; a dedup por conteúdo continua no
+# cache_data de carregar_dados, que é chaveado nos bytes.
+if file:
+    chave = file.file_id
+elif os.path.exists(ARQUIVO_DEFAULT):
+    st.sidebar.caption("Usando o relatório de exemplo.")
+    chave = "__default__"
+else:
     st.info("Envie um arquivo para iniciar a análise.")
     st.stop()
 
-df = pd.read_excel(file) if file.name.endswith("xlsx") else pd.read_csv(file)
-
-col = normalizar_colunas(df)
+if st.session_state.get("base_chave") != chave:
+    st.session_state["base"] = (
+        carregar_dados(file.getvalue(), file.name) if file else carregar_default()
+    )
+    st.session_state["base_chave"] = chave
 
-essenciais = ["data", "cliente", "valor"]
-faltando = [c for c in essenciais if not col[c]]
+df, col, faltando = st.session_state["base"]
 
 if faltando:
     st.error(f"⚠ O arquivo não possui as colunas essenciais: {', '.join(faltando)}")
     st.stop()
 
-df = preparar_dataframe(df, col)
-
 # ==============================
 # FILTROS
 # ==============================
 
 anos = sorted(df["ano"].dropna().unique())
+
+# Arquivo com coluna de data presente mas sem nenhuma data parseável:
+# sem este guard, ano_sel seria None e o filtro de ano estouraria.
+if not anos:
+    st.warning("⚠ Nenhuma data válida encontrada no arquivo.")
+    st.stop()
+
 ano_sel = st.sidebar.selectbox("Ano", anos)
 
 meses = sorted(df[df["ano"] == ano_sel]["mes"].dropna().unique())
@@ -157,7 +387,47 @@ if comparar and len(anos) > 1:
     ano_comp = st.sidebar.selectbox("Ano comparação", [a for a in anos if a != ano_sel])
 
 
-df_filtrado = df[(df["ano"] == ano_sel) & (df["mes"].isin(mes_sel))]
+# O frame está ordenado por (ano, mes); NAs de data ficam no fim e o
+# na_value=inf os mantém fora de qualquer fatia de ano real.
+anos_arr = df["ano"].to_numpy(dtype="float64", na_value=np.inf)
+lo, hi = np.searchsorted(anos_arr, [ano_sel, ano_sel + 1])
+df_ano = df.iloc[lo:hi]
+
+mask = np.isin(df_ano["mes"].to_numpy(dtype="float64", na_value=np.inf),
+               np.asarray(sorted(mes_sel), dtype="float64"))
+df_filtrado = df_ano.take(np.flatnonzero(mask))
+
+
+# ==============================
+# AGREGADOS COMPARTILHADOS
+# ==============================
+
+# Um único groupby por cliente alimenta KPIs, Top 10, Curva ABC e matriz;
+# cada passada separada re-hashearia a coluna e percorreria o frame inteiro.
+# O prefixo "_" pula o hash do frame: a chave barata (arquivo + filtros)
+# já identifica o resultado, então reruns nem tocam o DataFrame.
+@st.cache_data(show_spinner=False)
+def agregados_cliente(_df_filtrado, chave):
+    return (
+        _df_filtrado.groupby("cliente_norm", observed=True, sort=False)
+        .agg(
+            faturamento=("valor_num", "sum"),
+            # "size" conta linhas por grupo sem ler nenhuma coluna de valores
+            frequencia=("valor_num", "size"),
+        )
+    )
+
+
+# Idem para o eixo temporal: evolução e comparação entre anos são fatias
+# de um único agregado (ano, mes) sobre o frame completo.
+@st.cache_data(show_spinner=False)
+def agregado_mensal(_df, chave):
+    return _df.groupby(["ano", "mes"], observed=True, sort=False)["valor_num"].sum()
+
+
+filtro_chave = (chave, ano_sel, tuple(sorted(mes_sel)))
+cliente_stats = agregados_cliente(df_filtrado, filtro_chave)
+mensal_por_ano = agregado_mensal(df, chave)
 
 
 # ==============================
@@ -165,20 +435,17 @@ df_filtrado = df[(df["ano"] == ano_sel) & (df["mes"].isin(mes_sel))]
 # ==============================
 
 faturamento = df_filtrado["valor_num"].sum()
-clientes_ativos = df_filtrado["cliente_norm"].nunique()
+clientes_ativos = len(cliente_stats)
 ticket_medio = faturamento / max(clientes_ativos,1)
 
-top5 = (
-    df_filtrado.groupby("cliente_norm")["valor_num"].sum()
-    .sort_values(ascending=False)
-)
-conc_top5 = top5.head(5).sum() / faturamento if faturamento else 0
+# nlargest usa heap parcial (O(G log N)) em vez de ordenar todos os clientes
+conc_top5 = cliente_stats["faturamento"].nlargest(5).sum() / faturamento if faturamento else 0
 
 kpi1, kpi2, kpi3, kpi4, kpi5 = st.columns(5)
 
-kpi1.metric("💰 Faturamento", f"R$ {faturamento:,.2f}".replace(",", "X").replace(".", ",").replace("X","."))
+kpi1.metric("💰 Faturamento", brl(faturamento))
 kpi2.metric("👥 Clientes Ativos", clientes_ativos)
-kpi3.metric("🏷 Ticket Médio", f"R$ {ticket_medio:,.2f}")
+kpi3.metric("🏷 Ticket Médio", brl(ticket_medio))
 kpi4.metric("🏦 Concentração Top 5", f"{conc_top5*100:.1f}%")
 kpi5.metric("📆 Meses Selecionados", len(mes_sel))
 
@@ -189,34 +456,52 @@ kpi5.metric("📆 Meses Selecionados", len(mes_sel))
 
 st.subheader("📈 Evolução Mensal do Faturamento")
 
-evol = (
-    df_filtrado.groupby("mes")["valor_num"].sum()
+# O frame é ordenado por (ano, mes) e o groupby usa sort=False, então o
+# agregado já sai em ordem cronológica — nenhum sort extra é necessário.
+evol = mensal_por_ano.loc[ano_sel]
+evol = evol[evol.index.isin(mes_sel)].reset_index()
+
+st.line_chart(evol, x="mes", y="valor_num")
+
+st.subheader("🗓 Faturamento Trimestral")
+
+# Reagrupa o agregado mensal (até 12 linhas) em trimestres via divisão
+# inteira — nenhuma passada extra sobre o frame completo.
+trimestral = (
+    evol.assign(trimestre=(evol["mes"].astype("int64") - 1) // 3 + 1)
+    .groupby("trimestre", observed=True, sort=False)["valor_num"].sum()
+    .sort_index()
     .reset_index()
-    .sort_values("mes")
 )
 
-st.line_chart(evol, x="mes", y="valor_num")
+st.bar_chart(trimestral, x="trimestre", y="valor_num")
 
 # Botões de exportação
-colA, colB = st.columns(2)
+colA, colB, colC = st.columns(3)
 with colA:
     st.download_button("⬇ Exportar Excel", exportar_excel(evol),
                        file_name="evolucao_mensal.xlsx")
 with colB:
     st.download_button("⬇ Exportar PDF", exportar_pdf(evol, "Evolução Mensal"),
                        file_name="evolucao_mensal.pdf")
+with colC:
+    st.download_button("⬇ Exportar Parquet", exportar_parquet(evol),
+                       file_name="evolucao_mensal.parquet")
 
 
 # ==============================
 # COMPARAÇÃO ENTRE ANOS
 # ==============================
 
-if ano_comp:
+# Cada seção independente vira um fragment: widgets internos disparam
+# rerun só da própria seção, sem re-executar o script inteiro.
+
+@st.fragment
+def secao_comparacao(mensal_por_ano, ano_sel, ano_comp):
     st.subheader(f"⚖ Comparação {ano_sel} × {ano_comp}")
 
-    df_comp = df[df["ano"].isin([ano_sel, ano_comp])]
     comp = (
-        df_comp.groupby(["ano","mes"])["valor_num"].sum()
+        mensal_por_ano.loc[[ano_sel, ano_comp]]
         .reset_index()
         .sort_values(["ano","mes"])
     )
@@ -224,82 +509,174 @@ if ano_comp:
     st.area_chart(comp, x="mes", y="valor_num", color="ano")
 
 
+if ano_comp:
+    secao_comparacao(mensal_por_ano, ano_sel, ano_comp)
+
+
 # ==============================
-# TOP 10 CLIENTES
+# SAZONALIDADE
 # ==============================
 
-st.subheader("🏆 Top 10 Clientes")
+st.subheader("🌦 Sazonalidade — Média Mensal entre Anos")
 
-top10 = (
-    df_filtrado.groupby("cliente_norm")["valor_num"].sum()
+# Reagrupa o agregado (ano, mes) — poucas dezenas de linhas — em vez de
+# refazer um groupby por mês sobre o frame completo.
+sazonalidade = (
+    mensal_por_ano.groupby(level="mes", observed=True, sort=False).mean()
+    .sort_index()
     .reset_index()
-    .sort_values("valor_num", ascending=False)
-    .head(10)
 )
 
-st.bar_chart(top10, x="cliente_norm", y="valor_num")
+st.bar_chart(sazonalidade, x="mes", y="valor_num")
 
-colA, colB = st.columns(2)
-with colA:
-    st.download_button("⬇ Exportar Excel", exportar_excel(top10),
-                       file_name="top10_clientes.xlsx")
-with colB:
-    st.download_button("⬇ Exportar PDF", exportar_pdf(top10, "Top 10 Clientes"),
-                       file_name="top10_clientes.pdf")
+
+# ==============================
+# TOP 10 CLIENTES
+# ==============================
+
+@st.fragment
+def secao_top10(cliente_stats):
+    st.subheader("🏆 Top 10 Clientes")
+
+    top10 = cliente_stats["faturamento"].nlargest(10).reset_index()
+
+    st.bar_chart(top10, x="cliente_norm", y="faturamento")
+
+    colA, colB, colC = st.columns(3)
+    with colA:
+        st.download_button("⬇ Exportar Excel", exportar_excel(top10),
+                           file_name="top10_clientes.xlsx")
+    with colB:
+        st.download_button("⬇ Exportar PDF", exportar_pdf(top10, "Top 10 Clientes"),
+                           file_name="top10_clientes.pdf")
+    with colC:
+        st.download_button("⬇ Exportar Parquet", exportar_parquet(top10),
+                           file_name="top10_clientes.parquet")
+
+
+secao_top10(cliente_stats)
 
 
 # ==============================
 # CURVA ABC CLIENTES
 # ==============================
 
-st.subheader("📊 Curva ABC — Clientes")
+# Formatação delegada ao navegador via column_config: o servidor envia os
+# floats crus, sem montar strings linha a linha.
+ABC_CONFIG = {
+    "percent": st.column_config.NumberColumn("% do total", format="percent"),
+    "acumulado": st.column_config.NumberColumn("% acumulado", format="percent"),
+}
 
-abc_clientes = curva_abc(df_filtrado, "cliente_norm")
-st.dataframe(abc_clientes)
 
-colA, colB = st.columns(2)
-with colA:
-    st.download_button("⬇ Excel ABC", exportar_excel(abc_clientes),
-                       file_name="curva_abc_clientes.xlsx")
-with colB:
-    st.download_button("⬇ PDF ABC", exportar_pdf(abc_clientes, "Curva ABC Clientes"),
-                       file_name="curva_abc_clientes.pdf")
+@st.fragment
+def secao_abc_clientes(cliente_stats):
+    st.subheader("📊 Curva ABC — Clientes")
+
+    abc_clientes = curva_abc(cliente_stats["faturamento"])
+    st.dataframe(abc_clientes, column_config=ABC_CONFIG)
+
+    colA, colB, colC = st.columns(3)
+    with colA:
+        st.download_button("⬇ Excel ABC", exportar_excel(abc_clientes),
+                           file_name="curva_abc_clientes.xlsx")
+    with colB:
+        st.download_button("⬇ PDF ABC", exportar_pdf(abc_clientes, "Curva ABC Clientes"),
+                           file_name="curva_abc_clientes.pdf")
+    with colC:
+        st.download_button("⬇ Parquet ABC", exportar_parquet(abc_clientes),
+                           file_name="curva_abc_clientes.parquet")
+
+
+secao_abc_clientes(cliente_stats)
 
 
 # ==============================
 # CURVA ABC PRODUTOS (SE EXISTIR)
 # ==============================
 
-if col["produto"]:
+@st.fragment
+def secao_abc_produtos(df_filtrado, produto_col):
     st.subheader("📦 Curva ABC — Produtos")
-    abc_prod = curva_abc(df_filtrado, col["produto"])
-    st.dataframe(abc_prod)
+    abc_prod = curva_abc(
+        df_filtrado.groupby(produto_col, observed=True, sort=False)["valor_num"].sum()
+    )
+    st.dataframe(abc_prod, column_config=ABC_CONFIG)
 
-    colA, colB = st.columns(2)
+    colA, colB, colC = st.columns(3)
     with colA:
         st.download_button("⬇ Excel", exportar_excel(abc_prod),
                            file_name="curva_abc_produtos.xlsx")
     with colB:
         st.download_button("⬇ PDF", exportar_pdf(abc_prod, "Curva ABC Produtos"),
                            file_name="curva_abc_produtos.pdf")
+    with colC:
+        st.download_button("⬇ Parquet", exportar_parquet(abc_prod),
+                           file_name="curva_abc_produtos.parquet")
+
+
+if col["produto"]:
+    secao_abc_produtos(df_filtrado, col["produto"])
 
 
 # ==============================
 # MATRIZ CLIENTE (VALOR x FREQUÊNCIA)
 # ==============================
 
-st.subheader("🧩 Matriz Cliente (Valor × Frequência)")
+@st.fragment
+def secao_matriz(cliente_stats):
+    st.subheader("🧩 Matriz Cliente (Valor × Frequência)")
 
-matriz = (
-    df_filtrado.groupby("cliente_norm")
-    .agg(
-        faturamento=("valor_num","sum"),
-        frequencia=("documento","count") if col["documento"] else ("valor_num","count")
+    matriz = cliente_stats.reset_index()
+
+    st.scatter_chart(matriz, x="frequencia", y="faturamento")
+
+    colA, colB = st.columns(2)
+    with colA:
+        st.download_button("⬇ Exportar Excel", exportar_excel(matriz),
+                           file_name="matriz_cliente.xlsx")
+    with colB:
+        st.download_button("⬇ Exportar Parquet", exportar_parquet(matriz),
+                           file_name="matriz_cliente.parquet")
+
+
+secao_matriz(cliente_stats)
+
+
+# ==============================
+# PROJEÇÕES E CENÁRIOS
+# ==============================
+
+@st.fragment
+def secao_projecoes(evol):
+    # Fragment com os próprios sliders: mexer na projeção não re-executa
+    # o restante do dashboard.
+    st.subheader("🔮 Projeções e Cenários")
+
+    meses_proj = st.slider("Meses projetados", 3, 24, 12)
+    taxa_planejada = st.slider("Crescimento planejado (% ao mês)", -10.0, 10.0, 2.0, step=0.5) / 100
+
+    ultimo_valor = evol["valor_num"].iloc[-1] if len(evol) else 0.0
+
+    cenarios = {
+        "Pessimista": -0.02,
+        "Conservador": 0.0,
+        "Otimista": 0.03,
+        "Planejado": taxa_planejada,
+    }
+
+    # np.cumprod produz a trajetória inteira de cada cenário em um único
+    # loop C, sem laço Python mês a mês.
+    df_proj = pd.DataFrame(
+        {nome: ultimo_valor * np.cumprod(np.full(meses_proj, 1.0 + taxa))
+         for nome, taxa in cenarios.items()},
+        index=pd.RangeIndex(1, meses_proj + 1, name="mes_futuro"),
     )
-    .reset_index()
-)
 
-st.scatter_chart(matriz, x="frequencia", y="faturamento")
+    st.line_chart(df_proj)
+
+    st.download_button("⬇ Exportar Excel", exportar_excel(df_proj.reset_index()),
+                       file_name="projecoes.xlsx")
+
 
-st.download_button("⬇ Exportar Excel", exportar_excel(matriz),
-                   file_name="matriz_cliente.xlsx")
+secao_projecoes(evol)